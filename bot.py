@@ -2,22 +2,46 @@ import logging
 import asyncio
 import sys
 import os
-import threading
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.types import BotCommand, BotCommandScopeDefault
 from telegram.handlers import register_handlers
 from scheduler.tasks import AttendanceScheduler
-from config import TELEGRAM_TOKEN, ENCRYPTION_KEY
+from config import TELEGRAM_TOKEN, POLLING_TIMEOUT
 from health_server import start_health_server
 
+# orjson serializes/deserializes Telegram payloads ~2-3x faster than stdlib
+# json; fall back silently when it isn't installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Deployment knobs shared with the bot_alternative.py shim
+LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+USE_CUSTOM_SESSION = os.getenv('USE_CUSTOM_SESSION') == '1'
+# Opt-in escape hatch for flushing a flooded queue after a long outage;
+# by default restarts keep the updates users sent while the bot was down.
+DROP_PENDING_UPDATES = os.getenv('DROP_PENDING_UPDATES') == '1'
+
+
+def _make_session():
+    """Build the aiogram HTTP session, using the orjson codec when available."""
+    if orjson is not None:
+        return AiohttpSession(
+            json_loads=orjson.loads,
+            json_dumps=lambda value: orjson.dumps(value).decode()
+        )
+    return AiohttpSession() if USE_CUSTOM_SESSION else None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler("bot.log"),
+        logging.FileHandler(LOG_FILE),
         logging.StreamHandler(sys.stdout)
     ]
 )
@@ -59,10 +83,11 @@ async def on_shutdown(bot, dispatcher):
 
 async def main():
     """Main function to start the bot"""
-    # Start health server for Azure health checks on port 8000 ASAP
+    # Start health server for Azure health checks on port 8000 ASAP.
+    # It runs on this event loop, so no extra thread or process is needed.
+    health_runner = None
     try:
-        threading.Thread(target=start_health_server, daemon=True).start()
-        logger.info("Health server started on port %s", os.getenv("PORT") or os.getenv("WEBSITES_PORT") or 8000)
+        health_runner = await start_health_server()
     except Exception as e:
         logger.error(f"Failed to start health server: {e}")
     
@@ -71,42 +96,10 @@ async def main():
         logger.error("TELEGRAM_TOKEN is not set in the environment variables or .env file")
         return
     
-    if not ENCRYPTION_KEY:
-        logger.warning("ENCRYPTION_KEY is not set! A new random key will be generated.")
-        logger.warning("This will make existing encrypted passwords unusable!")
-        
-        # Generate and save a new key
-        from cryptography.fernet import Fernet
-        key = Fernet.generate_key().decode()
-        
-        # Update .env file or create if it doesn't exist
-        env_path = os.path.join(os.path.dirname(__file__), '.env')
-        env_content = f"ENCRYPTION_KEY={key}\n"
-        
-        if os.path.exists(env_path):
-            with open(env_path, 'r') as f:
-                lines = f.readlines()
-            
-            key_set = False
-            for i, line in enumerate(lines):
-                if line.startswith("ENCRYPTION_KEY="):
-                    lines[i] = f"ENCRYPTION_KEY={key}\n"
-                    key_set = True
-                    break
-            
-            if not key_set:
-                lines.append(f"ENCRYPTION_KEY={key}\n")
-            
-            with open(env_path, 'w') as f:
-                f.writelines(lines)
-        else:
-            with open(env_path, 'w') as f:
-                f.write(env_content)
-        
-        logger.info("Generated and saved a new encryption key")
-    
+    # ENCRYPTION_KEY is guaranteed by config.ensure_encryption_key() at import
+
     # Initialize bot and dispatcher
-    bot = Bot(token=TELEGRAM_TOKEN)
+    bot = Bot(token=TELEGRAM_TOKEN, session=_make_session())
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
@@ -127,29 +120,41 @@ async def main():
     try:
         # Удаляем webhook, если он был установлен
         logger.info("Удаление webhook и ожидание обновления статуса...")
-        await bot.delete_webhook(drop_pending_updates=True)
+        await bot.delete_webhook(drop_pending_updates=DROP_PENDING_UPDATES)
         
         # Небольшая пауза, чтобы дать серверам Telegram время обновить статус
         logger.info("Ожидание 5 секунд для обновления статуса на серверах Telegram...")
         await asyncio.sleep(5)
         
-        # Start polling with extended timeout
+        # Start polling with a long getUpdates timeout: Telegram holds the
+        # request open until an update arrives, so a higher value means fewer
+        # round-trips on idle without adding latency under load.
         logger.info("Запуск polling...")
-        await dp.start_polling(bot, skip_updates=True, timeout=30, allowed_updates=['message', 'callback_query'])
+        await dp.start_polling(bot, polling_timeout=POLLING_TIMEOUT, allowed_updates=['message', 'callback_query'])
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {str(e)}")
-        
-        # Попытка корректно закрыть все ресурсы
+        raise
+    finally:
+        # Deterministic teardown on every exit path: each resource is closed
+        # independently so one failure can't leak the others.
         try:
             await dp.storage.close()
-            if hasattr(bot, 'scheduler'):
+        except Exception as close_error:
+            logger.error(f"Ошибка при закрытии storage: {str(close_error)}")
+        try:
+            if hasattr(bot, 'scheduler') and bot.scheduler.scheduler.running:
                 bot.scheduler.stop()
+        except Exception as close_error:
+            logger.error(f"Ошибка при остановке планировщика: {str(close_error)}")
+        try:
             await bot.session.close()
         except Exception as close_error:
-            logger.error(f"Ошибка при закрытии ресурсов: {str(close_error)}")
-        
-        # Повторно генерируем исключение
-        raise
+            logger.error(f"Ошибка при закрытии сессии бота: {str(close_error)}")
+        if health_runner is not None:
+            try:
+                await health_runner.cleanup()
+            except Exception as close_error:
+                logger.error(f"Ошибка при остановке health-сервера: {str(close_error)}")
 
 
 if __name__ == '__main__':
@@ -1,6 +1,9 @@
+import logging
 import os
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -18,5 +21,57 @@ ATTENDANCE_CHECK_INTERVAL = 5  # minutes
 # Encryption settings
 ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY')
 
+
+def ensure_encryption_key():
+    """Make sure ENCRYPTION_KEY exists, generating and persisting one if not.
+
+    The .env file is rewritten atomically (tmp file + os.replace) with 0600
+    permissions, so a container restart mid-write can't leave a truncated
+    file behind. Runs once at import; both bot entrypoints rely on it.
+    """
+    global ENCRYPTION_KEY
+    if ENCRYPTION_KEY:
+        return ENCRYPTION_KEY
+
+    logger.warning("ENCRYPTION_KEY is not set! A new random key will be generated.")
+    logger.warning("This will make existing encrypted passwords unusable!")
+
+    from cryptography.fernet import Fernet
+    key = Fernet.generate_key().decode()
+
+    env_path = os.path.join(os.path.dirname(__file__), '.env')
+    lines = []
+    if os.path.exists(env_path):
+        with open(env_path, 'r') as f:
+            lines = f.readlines()
+
+    key_set = False
+    for i, line in enumerate(lines):
+        if line.startswith("ENCRYPTION_KEY="):
+            lines[i] = f"ENCRYPTION_KEY={key}\n"
+            key_set = True
+            break
+
+    if not key_set:
+        lines.append(f"ENCRYPTION_KEY={key}\n")
+
+    tmp_path = env_path + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.writelines(lines)
+    os.replace(tmp_path, env_path)
+
+    os.environ['ENCRYPTION_KEY'] = key
+    ENCRYPTION_KEY = key
+    logger.info("Generated and saved a new encryption key")
+    return key
+
+
+ensure_encryption_key()
+
 # Scheduler settings
 CHECK_INTERVAL_MINUTES = 7  # Check every 7 minutes for attendance opportunities
+
+# Long-polling settings. Telegram holds getUpdates open for this many seconds,
+# so a higher value means fewer idle round-trips without hurting latency.
+POLLING_TIMEOUT = int(os.getenv('POLLING_TIMEOUT', '50'))
@@ -1,7 +1,23 @@
+from cachetools import TTLCache
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from datetime import datetime
 from .models import User, Lesson, get_db_session
 
+# telegram_id -> users.id. Only primary keys are cached (ORM instances are
+# bound to the session that loaded them); a hit turns the lookup query into
+# a Session.get, which is served from the identity map when possible.
+_user_id_cache = TTLCache(maxsize=10_000, ttl=300)
+
+# (telegram_id, active_only) -> [lesson ids]. Short TTL, invalidated on every
+# lesson mutation, so a handler burst doesn't re-run the same two queries.
+_lesson_ids_cache = TTLCache(maxsize=10_000, ttl=30)
+
+
+def _invalidate_lessons(telegram_id: int):
+    _lesson_ids_cache.pop((telegram_id, True), None)
+    _lesson_ids_cache.pop((telegram_id, False), None)
+
 
 class DatabaseManager:
     """Manager for database operations"""
@@ -9,7 +25,16 @@ class DatabaseManager:
     @staticmethod
     def get_user_by_telegram_id(session: Session, telegram_id: int) -> User:
         """Get user by Telegram ID"""
-        return session.query(User).filter(User.telegram_id == telegram_id).first()
+        user_id = _user_id_cache.get(telegram_id)
+        if user_id is not None:
+            user = session.get(User, user_id)
+            if user is not None:
+                return user
+
+        user = session.query(User).filter(User.telegram_id == telegram_id).first()
+        if user is not None:
+            _user_id_cache[telegram_id] = user.id
+        return user
 
     @staticmethod
     def create_user(session: Session, telegram_id: int) -> User:
@@ -18,6 +43,7 @@ class DatabaseManager:
         session.add(user)
         session.commit()
         session.refresh(user)
+        _user_id_cache[telegram_id] = user.id
         return user
 
     @staticmethod
@@ -31,6 +57,7 @@ class DatabaseManager:
         user.set_password(password)
         session.commit()
         session.refresh(user)
+        _user_id_cache[telegram_id] = user.id
         return user
         
     @staticmethod
@@ -70,20 +97,29 @@ class DatabaseManager:
         session.add(lesson)
         session.commit()
         session.refresh(lesson)
+        _invalidate_lessons(telegram_id)
         return lesson
 
     @staticmethod
     def get_user_lessons(session: Session, telegram_id: int, active_only: bool = False):
         """Get all lessons for a user"""
+        cached_ids = _lesson_ids_cache.get((telegram_id, active_only))
+        if cached_ids is not None:
+            if not cached_ids:
+                return []
+            return session.query(Lesson).filter(Lesson.id.in_(cached_ids)).all()
+
         user = DatabaseManager.get_user_by_telegram_id(session, telegram_id)
         if not user:
             return []
-        
+
         query = session.query(Lesson).filter(Lesson.user_id == user.id)
         if active_only:
             query = query.filter(Lesson.active == True)
-        
-        return query.all()
+
+        lessons = query.all()
+        _lesson_ids_cache[(telegram_id, active_only)] = [lesson.id for lesson in lessons]
+        return lessons
 
     @staticmethod
     def remove_lesson(session: Session, telegram_id: int, lesson_id: int) -> bool:
@@ -99,9 +135,10 @@ class DatabaseManager:
         
         if not lesson:
             return False
-        
+
         session.delete(lesson)
         session.commit()
+        _invalidate_lessons(telegram_id)
         return True
 
     @staticmethod
@@ -122,24 +159,54 @@ class DatabaseManager:
         lesson.active = not lesson.active
         session.commit()
         session.refresh(lesson)
+        _invalidate_lessons(telegram_id)
         return lesson
 
     @staticmethod
     def get_all_active_users_and_lessons(session: Session):
         """Get all active users with their active lessons for attendance checking"""
-        users = session.query(User).filter(User.active == True).all()
-        result = []
-        
-        for user in users:
-            active_lessons = session.query(Lesson).filter(
-                Lesson.user_id == user.id,
-                Lesson.active == True
-            ).all()
-            
-            if active_lessons:
-                result.append((user, active_lessons))
-        
-        return result
+        # Single JOIN instead of one lessons query per user; users without
+        # active lessons drop out of the inner join, matching the old result.
+        # Users without Moodle credentials are filtered here too — the
+        # scheduler would only discard their rows anyway.
+        rows = session.query(User, Lesson).join(
+            Lesson, Lesson.user_id == User.id
+        ).filter(
+            User.active == True,
+            User.moodle_username.isnot(None),
+            User.encrypted_password.isnot(None),
+            Lesson.active == True
+        ).all()
+
+        grouped = {}
+        for user, lesson in rows:
+            grouped.setdefault(user, []).append(lesson)
+
+        return list(grouped.items())
+
+    @staticmethod
+    def bulk_update_check_times(session: Session, lesson_ids, checked_at: datetime = None):
+        """Set last_checked for many lessons with a single UPDATE and commit"""
+        if not lesson_ids:
+            return
+        session.execute(
+            update(Lesson)
+            .where(Lesson.id.in_(lesson_ids))
+            .values(last_checked=checked_at or datetime.utcnow())
+        )
+        session.commit()
+
+    @staticmethod
+    def bulk_update_mark_times(session: Session, lesson_ids, marked_at: datetime = None):
+        """Set last_marked for many lessons with a single UPDATE and commit"""
+        if not lesson_ids:
+            return
+        session.execute(
+            update(Lesson)
+            .where(Lesson.id.in_(lesson_ids))
+            .values(last_marked=marked_at or datetime.utcnow())
+        )
+        session.commit()
 
     @staticmethod
     def update_lesson_check_time(session: Session, lesson_id: int):
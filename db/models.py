@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, create_engine
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 import datetime
@@ -14,8 +15,10 @@ fernet = Fernet(ENCRYPTION_KEY.encode() if ENCRYPTION_KEY else Fernet.generate_k
 class User(Base):
     __tablename__ = 'users'
     
+    __table_args__ = (Index('ix_users_active', 'active'),)
+
     id = Column(Integer, primary_key=True)
-    telegram_id = Column(Integer, unique=True, nullable=False)
+    telegram_id = Column(Integer, unique=True, nullable=False, index=True)
     moodle_username = Column(String, nullable=True)
     encrypted_password = Column(String, nullable=True)
     group = Column(String, nullable=True)  # Group name (e.g., 'ІТШІ', 'КНТ', 'ІТУ')
@@ -39,7 +42,11 @@ class User(Base):
 
 class Lesson(Base):
     __tablename__ = 'lessons'
-    
+
+    # The scheduler filters on (user_id, active) every tick; without this
+    # index SQLite falls back to a full table scan per user.
+    __table_args__ = (Index('ix_lessons_user_active', 'user_id', 'active'),)
+
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
     url = Column(String, nullable=False)
@@ -52,15 +59,90 @@ class Lesson(Base):
     user = relationship("User", back_populates="lessons")
 
 
+# SQLite connections are handed out by the pool across the scheduler thread
+# and the event loop; check_same_thread must be off for that to work.
+_connect_args = {"check_same_thread": False} if DATABASE_URL.startswith('sqlite') else {}
+
+# For server databases, bound the pool and recycle/ping stale connections;
+# none of these apply to SQLite, where a "connection" is just a file handle.
+_engine_kwargs = {} if DATABASE_URL.startswith('sqlite') else {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+
 # Database initialization
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, connect_args=_connect_args, **_engine_kwargs)
+
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    """Apply per-connection SQLite PRAGMAs.
+
+    WAL lets the scheduler read while a handler commits (no more
+    "database is locked"), synchronous=NORMAL halves the fsyncs per
+    commit (still durable in WAL mode), and busy_timeout makes SQLite
+    wait instead of raising when two writers do collide.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.close()
+
+
+if DATABASE_URL.startswith('sqlite'):
+    event.listens_for(engine, 'connect')(_tune_sqlite)
+
 Base.metadata.create_all(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def _async_database_url(url):
+    """Map the configured database URL onto its async driver equivalent.
+
+    create_async_engine refuses sync drivers at import time, which would
+    take the whole app down, so every dialect the sync engine accepts
+    must be rewritten here. URLs that already name an explicit driver
+    (a "+" in the scheme) are trusted as-is.
+    """
+    scheme = url.split('://', 1)[0]
+    if '+' in scheme:
+        return url
+    if url.startswith('sqlite'):
+        return url.replace('sqlite', 'sqlite+aiosqlite', 1)
+    if url.startswith('postgresql'):
+        return url.replace('postgresql', 'postgresql+asyncpg', 1)
+    if url.startswith('postgres://'):
+        return url.replace('postgres', 'postgresql+asyncpg', 1)
+    if url.startswith('mysql'):
+        return url.replace('mysql', 'mysql+aiomysql', 1)
+    return url
+
+
+# Async engine for callers running on the event loop; the sync engine stays
+# for the Telegram handlers, which use blocking sessions.
+async_engine = create_async_engine(_async_database_url(DATABASE_URL), connect_args=_connect_args, **_engine_kwargs)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if DATABASE_URL.startswith('sqlite'):
+    # Same PRAGMAs for aiosqlite connections (listeners hang off the
+    # underlying sync engine).
+    event.listens_for(async_engine.sync_engine, 'connect')(_tune_sqlite)
+
+
 def get_db_session():
     """Get database session."""
     # IMPORTANT: Do NOT close the session here. The caller is responsible for
     # closing it (most call sites already use try/finally to close).
     # Returning a session that is immediately closed breaks all DB operations.
     return SessionLocal()
+
+
+def get_async_db_session():
+    """Get an async database session. As with get_db_session, the caller
+    is responsible for closing it (`async with` is the usual pattern)."""
+    return AsyncSessionLocal()
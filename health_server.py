@@ -1,23 +1,48 @@
-from flask import Flask, jsonify
+import logging
 import os
 
-app = Flask(__name__)
+from aiohttp import web
 
-@app.get("/")
-def root():
-    return "OK", 200
+try:
+    import orjson
 
-@app.get("/healthz")
-def healthz():
-    return jsonify(status="healthy"), 200
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    import json
 
+    _json_dumps = json.dumps
 
-def start_health_server(port: int | None = None):
+logger = logging.getLogger(__name__)
+
+
+async def root(request):
+    return web.Response(text="OK")
+
+
+async def healthz(request):
+    return web.json_response({"status": "healthy"}, dumps=_json_dumps)
+
+
+async def start_health_server(port: int | None = None) -> web.AppRunner:
     """Start a minimal HTTP server for Azure health checks.
 
     Azure App Service on Linux pings the container on a specific port (default 8000).
-    This server ensures the container responds so the app is considered healthy.
+    The server runs on the bot's own event loop (no extra thread or WSGI stack),
+    so health responses are served in sub-millisecond time.
+
+    Returns the AppRunner; call `await runner.cleanup()` on shutdown.
     """
     port = int(port or os.getenv("PORT") or os.getenv("WEBSITES_PORT") or 8000)
-    # Run in production-friendly mode without reloader and with 0.0.0.0 binding
-    app.run(host="0.0.0.0", port=port, use_reloader=False)
+
+    app = web.Application()
+    app.router.add_get("/", root)
+    app.router.add_get("/healthz", healthz)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "0.0.0.0", port)
+    await site.start()
+
+    logger.info(f"Health server listening on port {port}")
+    return runner
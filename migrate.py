@@ -0,0 +1,32 @@
+"""One-off migration: create the query indexes on an existing database.
+
+Base.metadata.create_all only creates missing tables, so databases created
+before the indexes were added to the models need them applied explicitly.
+Safe to run repeatedly (IF NOT EXISTS).
+"""
+import logging
+
+from sqlalchemy import text
+
+from db.models import engine
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+INDEXES = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_telegram_id ON users (telegram_id)",
+    "CREATE INDEX IF NOT EXISTS ix_users_active ON users (active)",
+    "CREATE INDEX IF NOT EXISTS ix_lessons_user_active ON lessons (user_id, active)",
+]
+
+
+def migrate():
+    with engine.begin() as conn:
+        for statement in INDEXES:
+            logger.info(f"Applying: {statement}")
+            conn.execute(text(statement))
+    logger.info("Migration complete")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -1,92 +1,550 @@
 import requests
-from bs4 import BeautifulSoup
+import aiohttp
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from aiolimiter import AsyncLimiter
+from bs4 import BeautifulSoup, SoupStrainer
+from cachetools import TTLCache
+import hashlib
 import logging
+import os
+import pickle
 import re
+import threading
 import time
 from datetime import datetime, timedelta
 import json
+import urllib3
 from config import MOODLE_BASE_URL, LOGIN_URL
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# orjson serializes the persisted caches a few times faster than stdlib
+# json; fall back silently when it isn't installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dump_json(obj):
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
+
+def _load_json(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+# Подавляем предупреждения о небезопасном SSL (once per process, not per client)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# One adapter — and therefore one urllib3 PoolManager — for every sync
+# client in the process: TLS handshakes to the Moodle host are amortized
+# across all users, while cookies stay per-session. Default urllib3 pools
+# hold 10 connections, which the threaded scans would churn through.
+_SHARED_ADAPTER = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=128,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
 )
+
+# Logging is configured once by the bot entrypoint; library modules only
+# take a named logger.
 logger = logging.getLogger(__name__)
 
+# Prefer the C-backed lxml parser (roughly 5-10x faster on big Moodle pages);
+# fall back to the stdlib parser when lxml isn't installed.
+try:
+    import lxml  # noqa: F401
+    _BS_PARSER = 'lxml'
+except ImportError:
+    _BS_PARSER = 'html.parser'
+
+# Parse only the subtrees the scrapers actually inspect; Moodle pages carry
+# a lot of navigation chrome that would otherwise be materialized for nothing.
+_LOGIN_FORM_STRAINER = SoupStrainer('form', id='login')
+_ATTENDANCE_STRAINER = SoupStrainer(['form', 'a', 'input', 'div', 'section'])
+_FORM_STRAINER = SoupStrainer('form')
+_COURSE_SCAN_STRAINER = SoupStrainer(['a', 'div', 'h3'])
+_COURSE_PAGE_STRAINER = SoupStrainer(['a', 'li'])
+
+# Hot-path patterns, compiled once instead of per call.
+_COURSE_ID_RE = re.compile(r'id=(\d+)')
+
+# Fast path for the dashboard: course anchors with plain-text names can be
+# sliced straight out of the raw HTML without building a DOM.
+_COURSE_LINK_RE = re.compile(
+    r'<a[^>]+href="([^"]*course/view\.php\?id=(\d+)[^"]*)"[^>]*>\s*([^<]+?)\s*</a>', re.I
+)
+_ATTEND_BTN_RE = re.compile(r'отметиться|submit attendance', re.I)
+_ATTEND_LINK_RE = re.compile(r'отметиться|mark attendance|submit attendance', re.I)
+_SUBMIT_TEXT_RE = re.compile(r'submit attendance|mark attendance|присутствие', re.I)
+_ATTEND_CLASS_RE = re.compile(r'attendance')
+
+# Known success markers in submission responses; one C-level scan instead of
+# lowercasing the whole body and running several substring searches.
+_SUCCESS_RE = re.compile(
+    r'attendance has been recorded|успешно|успішно|відмічено|attendance: status set', re.I
+)
+
+# Label substrings that identify the "Present" radio on attendance forms.
+_PRESENT_KEYWORDS = ('present', 'присутств', 'присутн', 'відвідав', 'відвідування')
+
+# Superset of every marker the availability options below look for; if none
+# of these substrings occur in the raw HTML there is no point building a DOM.
+_ATTEND_HINT_RE = re.compile(r'отметиться|присутствие|attendance', re.I)
+
+# The login page is only fetched for its logintoken hidden input; a single
+# regex pass finds it without building a DOM for the whole page. The second
+# pattern covers templates that emit value= before name=.
+_LOGIN_TOKEN_RE = re.compile(r'name="logintoken"[^>]*value="([^"]+)"')
+_LOGIN_TOKEN_REV_RE = re.compile(r'value="([^"]+)"[^>]*name="logintoken"')
+
+
+# One Fernet for the whole module: construction base64-decodes the key and
+# sets up HMAC/AES state, which is wasted work when repeated per client
+# instance (one per user per scheduler tick). Built lazily so importing this
+# module never pays for (or fails on) the cryptography setup.
+_FERNET = None
+
+
+def _get_fernet():
+    """Return the shared Fernet instance, creating it on first use."""
+    global _FERNET
+    if _FERNET is None:
+        try:
+            from cryptography.fernet import Fernet
+            from config import ENCRYPTION_KEY
+            _FERNET = Fernet(ENCRYPTION_KEY.encode()) if ENCRYPTION_KEY else None
+        except Exception as e:
+            logger.error("Error initializing encryption: %s", e)
+            return None
+    return _FERNET
+
+
+def _decrypt_password(password, is_encrypted):
+    """Return the plain-text password, decrypting it if necessary."""
+    if not (is_encrypted and password):
+        return password
+    fernet = _get_fernet()
+    if fernet is None:
+        logger.error("ENCRYPTION_KEY not found in config")
+        return None
+    try:
+        return fernet.decrypt(password.encode()).decode()
+    except Exception as e:
+        logger.error("Error decrypting password: %s", e)
+        return None
+
+
+def _extract_login_token(html):
+    """Extract the hidden logintoken value from the Moodle login page."""
+    # Fast path: regex scan of the raw markup in either attribute order.
+    # BeautifulSoup is only needed for exotic template variants.
+    match = _LOGIN_TOKEN_RE.search(html) or _LOGIN_TOKEN_REV_RE.search(html)
+    if match:
+        return match.group(1)
+
+    soup = BeautifulSoup(html, _BS_PARSER, parse_only=_LOGIN_FORM_STRAINER)
+
+    # Find login form
+    login_form = soup.find('form', {'id': 'login'})
+    if not login_form:
+        logger.error("Could not find login form")
+        return None
+
+    # Extract token
+    token_input = login_form.find('input', {'name': 'logintoken'})
+    if not token_input:
+        logger.error("Could not find login token")
+        return None
+
+    return token_input.get('value', '')
+
+
+def _parse_attendance_page(html):
+    """Parse a lesson page and determine whether attendance can be marked.
+
+    Returns a result dict with 'status' of 'available' or 'not_available'.
+    """
+    # Fast path: one C-level regex scan over the text. Pages without any
+    # attendance marker (the common case between classes) skip parsing entirely.
+    if not _ATTEND_HINT_RE.search(html):
+        return {'status': 'not_available', 'message': 'No attendance marking option found'}
+
+    soup = BeautifulSoup(html, _BS_PARSER, parse_only=_ATTENDANCE_STRAINER)
+
+    # Collect every candidate (button, links, attendance section) in one DOM
+    # pass; the five original options each re-traversed the whole tree.
+    attendance_btn = None
+    exact_link_url = None
+    regex_link_url = None
+    text_link_url = None
+    section_seen = False
+    section_form_found = False
+    section_form_action = None
+    for el in soup.find_all(['input', 'a', 'div', 'section']):
+        if el.name == 'input':
+            if attendance_btn is None and _ATTEND_BTN_RE.search(el.get('value') or ''):
+                attendance_btn = el
+        elif el.name == 'a':
+            href = el.get('href')
+            if not href:
+                continue
+            link_text = el.string
+            if link_text:
+                if exact_link_url is None and link_text == "Submit attendance" \
+                        and 'attendance.php' in href:
+                    exact_link_url = href
+                if regex_link_url is None and _ATTEND_LINK_RE.search(link_text):
+                    regex_link_url = href
+            if text_link_url is None and _SUBMIT_TEXT_RE.search(el.get_text()):
+                text_link_url = href
+        else:
+            # div/section: first attendance container decides, as soup.find did
+            if not section_seen \
+                    and _ATTEND_CLASS_RE.search(' '.join(el.get('class') or [])):
+                section_seen = True
+                form = el.find('form')
+                if form:
+                    section_form_found = True
+                    section_form_action = form.get('action')
+
+    # Option 1: Direct "Submit attendance" button takes priority below.
+
+    # Option 2: Exact link text matching "Submit attendance"
+    if not attendance_btn and exact_link_url:
+        logger.info("Found 'Submit attendance' link: %s", exact_link_url)
+        return {'status': 'available', 'form_url': exact_link_url}
+
+    # Option 3: Attendance status link with regex pattern
+    if not attendance_btn and regex_link_url:
+        logger.info("Found attendance link with regex: %s", regex_link_url)
+        return {'status': 'available', 'form_url': regex_link_url}
+
+    # Option 4: "Submit attendance"-like text anywhere inside a link
+    if text_link_url:
+        logger.info("Found attendance text with parent link: %s", text_link_url)
+        return {'status': 'available', 'form_url': text_link_url}
+
+    # Option 5: Form inside an attendance section
+    if section_form_found:
+        return {'status': 'available', 'form_action': section_form_action}
+
+    if attendance_btn:
+        return {'status': 'available', 'button_found': True}
+
+    # No attendance found
+    return {'status': 'not_available', 'message': 'No attendance marking option found'}
+
+
+def _build_attendance_payload(html, form_url):
+    """Build the (action, payload) pair for submitting an attendance form.
+
+    Returns None when no form is present on the page.
+    """
+    soup = BeautifulSoup(html, _BS_PARSER, parse_only=_FORM_STRAINER)
+    form = soup.find('form')
+    if not form:
+        return None
+
+    # Build payload from inputs
+    payload = {}
+    radios = []
+    for inp in form.find_all('input'):
+        name = inp.get('name')
+        if not name:
+            continue
+        itype = (inp.get('type') or '').lower()
+        if itype in ['radio', 'checkbox']:
+            if itype == 'radio':
+                radios.append(inp)
+            continue
+        payload[name] = inp.get('value', '')
+
+    # Try to pick "Present"-like status
+    chosen = False
+    for r in radios:
+        label = r.find_parent('label')
+        if not label:
+            continue
+        label_text = label.get_text(strip=True).lower()
+        if any(k in label_text for k in _PRESENT_KEYWORDS):
+            payload[r.get('name')] = r.get('value')
+            chosen = True
+            break
+    if not chosen and radios:
+        payload[radios[0].get('name')] = radios[0].get('value')
+
+    # Determine action
+    action = form.get('action') or form_url
+    if action.startswith('/'):
+        action = f"{MOODLE_BASE_URL}{action}"
+
+    return action, payload
+
+
+def _parse_courses(html):
+    """Extract course dicts (id, name, url) from dashboard HTML."""
+    # Fast path: slice the anchors straight out of the markup. Falls back to
+    # the DOM scan when the theme nests the course name in child elements.
+    courses = []
+    seen_ids = set()
+    for match in _COURSE_LINK_RE.finditer(html):
+        course_url, course_id, course_name = match.group(1), match.group(2), match.group(3)
+        if course_id not in seen_ids:
+            seen_ids.add(course_id)
+            courses.append({
+                'id': course_id,
+                'name': course_name,
+                'url': course_url
+            })
+    if courses:
+        return courses
+
+    soup = BeautifulSoup(html, _BS_PARSER, parse_only=_COURSE_SCAN_STRAINER)
+    courses = []
+
+    # Look for course cards or links
+    # CSS substring selectors run in soupsieve's compiled matcher instead
+    # of calling a Python regex per tag attribute.
+    course_cards = soup.select('div[class*="course"]')
+    if not course_cards:
+        # Try finding course links directly
+        course_links = soup.select('a[href*="/course/view.php"]')
+        for link in course_links:
+            course_url = link.get('href')
+            course_name = link.text.strip()
+            if course_url and course_name:
+                course_id = _COURSE_ID_RE.search(course_url)
+                if course_id:
+                    courses.append({
+                        'id': course_id.group(1),
+                        'name': course_name,
+                        'url': course_url
+                    })
+    else:
+        for card in course_cards:
+            link = card.select_one('a[href*="/course/view.php"]')
+            if link:
+                course_url = link.get('href')
+                course_name = link.text.strip()
+                if not course_name:
+                    # Try to find course name in another element
+                    title = card.find('h3') or card.find('div', {'class': 'coursename'})
+                    if title:
+                        course_name = title.text.strip()
+
+                course_id = _COURSE_ID_RE.search(course_url)
+                if course_id:
+                    courses.append({
+                        'id': course_id.group(1),
+                        'name': course_name,
+                        'url': course_url
+                    })
+
+    return courses
+
+
+def _parse_attendance_links(html):
+    """Extract attendance activity links (url, name) from a course page."""
+    soup = BeautifulSoup(html, _BS_PARSER, parse_only=_COURSE_PAGE_STRAINER)
+    attendance_links = []
+    seen_urls = set()  # O(1) dedup instead of scanning the list per link
+
+    # Look for attendance modules
+    attendance_modules = soup.select('li[class*="attendance"]')
+    for module in attendance_modules:
+        link = module.find('a')
+        if link:
+            href = link.get('href')
+            name = link.text.strip()
+            if href and href not in seen_urls:
+                seen_urls.add(href)
+                attendance_links.append({
+                    'url': href,
+                    'name': name
+                })
+
+    # Also search for links containing 'attendance.php'
+    attendance_urls = soup.select('a[href*="attendance.php"]')
+    for url in attendance_urls:
+        href = url.get('href')
+        name = url.text.strip()
+        if href and href not in seen_urls:
+            seen_urls.add(href)
+            attendance_links.append({
+                'url': href,
+                'name': name
+            })
+
+    return attendance_links
+
+
+def _is_submit_successful(body):
+    """Check a submission response body for known success markers."""
+    return _SUCCESS_RE.search(body) is not None
+
 
 class MoodleClient:
     """Client for interacting with Moodle LMS"""
-    
+
+    # Handlers build a fresh client per request, which used to discard the
+    # course/attendance caches immediately. Shared per-username dicts keep
+    # them warm across instances; the lock only guards dict creation.
+    _courses_cache_by_user = {}
+    _attendance_cache_by_user = {}
+    _cache_lock = threading.Lock()
+
     def __init__(self, username=None, password=None, is_encrypted=False):
         self.username = username
-        
-        # Handle encrypted passwords
-        if is_encrypted and password:
-            try:
-                from cryptography.fernet import Fernet
-                from config import ENCRYPTION_KEY
-                if not ENCRYPTION_KEY:
-                    logger.error("ENCRYPTION_KEY not found in config")
-                    self.password = None
-                else:
-                    fernet = Fernet(ENCRYPTION_KEY.encode())
-                    self.password = fernet.decrypt(password.encode()).decode()
-            except Exception as e:
-                logger.error(f"Error decrypting password: {e}")
-                self.password = None
-        else:
-            self.password = password
-        
+        self.password = _decrypt_password(password, is_encrypted)
+
         self.session = requests.Session()
+        self.session.mount('https://', _SHARED_ADAPTER)
+        self.session.mount('http://', _SHARED_ADAPTER)
         # Отключаем проверку SSL-сертификата (не рекомендуется для продакшена, но решает проблему с сертификатом)
         self.session.verify = False
-        # Подавляем предупреждения о небезопасном SSL
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         self.is_logged_in = False
-        
-        # Кэш для хранения информации о курсах и доступных отметках
-        self.courses_cache = {}  # {course_id: {name, url, last_updated}}
-        self.attendance_cache = {}  # {attendance_url: {status, last_checked}}
+
+        # MoodleSession cookies stay valid for hours; reloading the jar from
+        # the previous run lets login() skip the two-round-trip form dance.
+        self._cookie_path = None
+        self._courses_path = None
+        if username:
+            digest = hashlib.sha256(username.encode()).hexdigest()[:16]
+            self._cookie_path = f'.moodle_cookies_{digest}.pickle'
+            self._courses_path = f'.moodle_courses_{digest}.json'
+            try:
+                if os.path.exists(self._cookie_path):
+                    with open(self._cookie_path, 'rb') as f:
+                        self.session.cookies.update(pickle.load(f))
+            except Exception as e:
+                logger.warning("Could not load saved cookies: %s", e)
+
         self.cache_ttl = 300  # Время жизни кэша в секундах (5 минут)
-    
+        self.negative_cache_ttl = 60  # 'not available' ages out faster
+
+        # Кэш для хранения информации о курсах и доступных отметках,
+        # общий для всех экземпляров с одним username. TTLCache evicts on
+        # its own, so long-lived processes can't accumulate stale entries.
+        with self._cache_lock:
+            self.courses_cache = self._courses_cache_by_user.setdefault(
+                username, TTLCache(maxsize=256, ttl=self.cache_ttl))  # {course_id: {name, url}}
+            self.attendance_cache = self._attendance_cache_by_user.setdefault(
+                username, TTLCache(maxsize=2048, ttl=self.cache_ttl))  # {url: (monotonic_ts, result)}
+
+        # Hydrate courses from the previous process run so startup doesn't
+        # force a full dashboard re-scan per user.
+        if self._courses_path and not self.courses_cache and os.path.exists(self._courses_path):
+            try:
+                with open(self._courses_path, 'rb') as f:
+                    self.courses_cache.update(_load_json(f.read()))
+            except Exception as e:
+                logger.warning("Could not load persisted course cache: %s", e)
+
+        # url -> (etag, last_modified, result) for conditional GETs; a 304
+        # revalidation skips both the body download and the re-parse.
+        self._etag_cache = {}
+
+        # Dashboard HTML memo: within the TTL not even the 304 revalidation
+        # round-trip is paid.
+        self._dashboard_cache = TTLCache(maxsize=1, ttl=self.cache_ttl)
+
+    def _conditional_get(self, url):
+        """GET url, revalidating with stored ETag/Last-Modified when known.
+
+        Returns (response, cached_result); cached_result is non-None when
+        the server answered 304 and the previous result is still valid.
+        """
+        headers = {}
+        entry = self._etag_cache.get(url)
+        if entry:
+            etag, last_modified, _ = entry
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        response = self.session.get(url, headers=headers or None)
+        if response.status_code == 304 and entry:
+            logger.info("Not modified, reusing cached result for %s", url)
+            return response, entry[2]
+        return response, None
+
+    def _store_validators(self, url, response, result):
+        """Remember the response validators so the next GET can revalidate."""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self._etag_cache[url] = (etag, last_modified, result)
+
+    def _cache_result(self, key, result):
+        """Store a check result and return it. Errors are never cached."""
+        if result.get('status') != 'error':
+            self.attendance_cache[key] = (time.monotonic(), result)
+        return result
+
+    def _cached_result(self, key):
+        """Return a still-fresh cached result for key, or None.
+
+        Entries are (monotonic_ts, result) tuples: one allocation, immune to
+        wall-clock jumps. Negative results use the shorter TTL so a class
+        opening for attendance is noticed within a minute.
+        """
+        entry = self.attendance_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        ttl = self.cache_ttl if result.get('status') == 'available' else self.negative_cache_ttl
+        if time.monotonic() - stored_at < ttl:
+            return result
+        return None
+
+    def _save_cookies(self):
+        """Persist the session cookie jar so later runs can skip login."""
+        if not self._cookie_path:
+            return
+        try:
+            with open(self._cookie_path, 'wb') as f:
+                pickle.dump(self.session.cookies, f)
+        except Exception as e:
+            logger.warning("Could not save cookies: %s", e)
+
     def validate_credentials(self):
         """Validate if the provided credentials can successfully log in to DL"""
         if not self.username or not self.password:
             logger.warning("Username or password not provided")
             return False
-        
-        # Try to log in and return the result
-        login_result = self.login()
-        logger.info(f"Credentials validation {'successful' if login_result else 'failed'} for user {self.username}")
+
+        # Force a real form login: a saved cookie can still be live while the
+        # supplied password is wrong, so the probe must not decide this.
+        login_result = self.login(force=True)
+        logger.info("Credentials validation %s for user %s", 'successful' if login_result else 'failed', self.username)
         return login_result
-    
-    def login(self):
-        """Log in to Moodle"""
+
+    def login(self, force=False):
+        """Log in to Moodle. With force=True the saved-cookie probe is
+        skipped and the credentials are always posted to the login form."""
         if not self.username or not self.password:
             logger.error("Username or password not provided")
             return False
-        
+
         try:
+            # A saved session cookie may still be valid; one GET to the
+            # dashboard settles it without touching the login form at all.
+            if not force and self.session.cookies and not self.is_logged_in:
+                probe = self.session.get(f"{MOODLE_BASE_URL}/my/")
+                if probe.status_code == 200 and '/login/' not in probe.url:
+                    self.is_logged_in = True
+                    logger.info("Reused saved Moodle session for %s", self.username)
+                    return True
+
             # Get login page to extract form token
             login_page = self.session.get(LOGIN_URL)
-            soup = BeautifulSoup(login_page.text, 'html.parser')
-            
-            # Find login form
-            login_form = soup.find('form', {'id': 'login'})
-            if not login_form:
-                logger.error("Could not find login form")
+            token = _extract_login_token(login_page.text)
+            if token is None:
                 return False
-            
-            # Extract token
-            token_input = login_form.find('input', {'name': 'logintoken'})
-            if not token_input:
-                logger.error("Could not find login token")
-                return False
-            
-            token = token_input.get('value', '')
-            
+
             # Prepare login payload
             payload = {
                 'username': self.username,
@@ -94,157 +552,116 @@ class MoodleClient:
                 'logintoken': token,
                 'anchor': ''
             }
-            
+
             # Submit login form
             login_response = self.session.post(LOGIN_URL, data=payload)
-            
+
             # Check if login was successful
             self.is_logged_in = 'loginerrors' not in login_response.url
             if self.is_logged_in:
-                logger.info(f"Successfully logged in as {self.username}")
+                logger.info("Successfully logged in as %s", self.username)
+                self._save_cookies()
             else:
-                logger.error(f"Failed to log in as {self.username}")
-            
+                logger.error("Failed to log in as %s", self.username)
+
             return self.is_logged_in
-        
+
         except Exception as e:
-            logger.error(f"Error during login: {str(e)}")
+            logger.error("Error during login: %s", str(e))
             return False
-    
+
     def get_dashboard(self):
         """Get user's Moodle dashboard to find all active courses"""
         if not self.is_logged_in:
             logged_in = self.login()
             if not logged_in:
                 return None
-        
+
+        cached_html = self._dashboard_cache.get('html')
+        if cached_html is not None:
+            return cached_html
+
         try:
             # Get the dashboard page
             dashboard_url = f"{MOODLE_BASE_URL}/my/"
-            response = self.session.get(dashboard_url)
+            response, cached_html = self._conditional_get(dashboard_url)
+            if cached_html is not None:
+                self._dashboard_cache['html'] = cached_html
+                return cached_html
             if response.status_code != 200:
-                logger.error(f"Failed to load dashboard: {response.status_code}")
+                logger.error("Failed to load dashboard: %s", response.status_code)
                 return None
-            
+
+            self._store_validators(dashboard_url, response, response.text)
+            self._dashboard_cache['html'] = response.text
             return response.text
         except Exception as e:
-            logger.error(f"Error getting dashboard: {str(e)}")
+            logger.error("Error getting dashboard: %s", str(e))
             return None
-    
+
     def scan_for_courses(self):
         """Scan the dashboard to find all active courses"""
         dashboard_html = self.get_dashboard()
         if not dashboard_html:
             return []
-        
-        soup = BeautifulSoup(dashboard_html, 'html.parser')
-        courses = []
-        
-        # Look for course cards or links
-        course_cards = soup.find_all('div', {'class': re.compile(r'course|coursebox')})
-        if not course_cards:
-            # Try finding course links directly
-            course_links = soup.find_all('a', {'href': re.compile(r'/course/view.php')})
-            for link in course_links:
-                course_url = link.get('href')
-                course_name = link.text.strip()
-                if course_url and course_name:
-                    course_id = re.search(r'id=(\d+)', course_url)
-                    if course_id:
-                        course_id = course_id.group(1)
-                        courses.append({
-                            'id': course_id,
-                            'name': course_name,
-                            'url': course_url
-                        })
-        else:
-            for card in course_cards:
-                link = card.find('a', {'href': re.compile(r'/course/view.php')})
-                if link:
-                    course_url = link.get('href')
-                    course_name = link.text.strip()
-                    if not course_name:
-                        # Try to find course name in another element
-                        title = card.find('h3') or card.find('div', {'class': 'coursename'})
-                        if title:
-                            course_name = title.text.strip()
-                    
-                    course_id = re.search(r'id=(\d+)', course_url)
-                    if course_id:
-                        course_id = course_id.group(1)
-                        courses.append({
-                            'id': course_id,
-                            'name': course_name,
-                            'url': course_url
-                        })
-        
-        # Update cache
-        now = time.time()
+
+        courses = _parse_courses(dashboard_html)
+        self._store_courses(courses)
+        return courses
+
+    def _store_courses(self, courses):
+        """Refresh the course cache with freshly scanned entries."""
         for course in courses:
             self.courses_cache[course['id']] = {
                 'name': course['name'],
-                'url': course['url'],
-                'last_updated': now
+                'url': course['url']
             }
-        
-        return courses
-    
+        self._persist_courses()
+
+    def _persist_courses(self):
+        """Write the course cache to disk so the next run starts warm.
+
+        No-op for clients without a username (the async client shares this
+        via its method aliases but keeps its caches in-process only).
+        """
+        path = getattr(self, '_courses_path', None)
+        if not path:
+            return
+        try:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(_dump_json(dict(self.courses_cache)))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Could not persist course cache: %s", e)
+
     def scan_course_for_attendance(self, course_url):
         """Scan a course page for attendance activities"""
         if not self.is_logged_in:
             logged_in = self.login()
             if not logged_in:
                 return []
-        
+
         try:
             # Get the course page
-            response = self.session.get(course_url)
+            response, cached_links = self._conditional_get(course_url)
+            if cached_links is not None:
+                return cached_links
             if response.status_code != 200:
-                logger.error(f"Failed to load course page: {response.status_code}")
+                logger.error("Failed to load course page: %s", response.status_code)
                 return []
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            attendance_links = []
-            
-            # Look for attendance modules
-            attendance_modules = soup.find_all('li', {'class': re.compile(r'modtype_attendance|attendance')})
-            for module in attendance_modules:
-                link = module.find('a')
-                if link:
-                    href = link.get('href')
-                    name = link.text.strip()
-                    if href:
-                        attendance_links.append({
-                            'url': href,
-                            'name': name
-                        })
-            
-            # Also search for links containing 'attendance.php'
-            attendance_urls = soup.find_all('a', {'href': re.compile(r'attendance.php')})
-            for url in attendance_urls:
-                href = url.get('href')
-                name = url.text.strip()
-                if href and not any(link['url'] == href for link in attendance_links):
-                    attendance_links.append({
-                        'url': href,
-                        'name': name
-                    })
-            
+
+            attendance_links = _parse_attendance_links(response.text)
+            self._store_validators(course_url, response, attendance_links)
             return attendance_links
         except Exception as e:
-            logger.error(f"Error scanning course for attendance: {str(e)}")
+            logger.error("Error scanning course for attendance: %s", str(e))
             return []
-    
+
     def find_all_active_attendance_marks(self):
         """Intelligent method to find all active attendance marks across all courses"""
-        # First check if we need to refresh course cache
-        now = time.time()
-        courses_expired = not self.courses_cache or all(
-            now - course_data['last_updated'] > self.cache_ttl 
-            for course_data in self.courses_cache.values()
-        )
-        
-        if courses_expired:
+        # TTLCache expires entries by itself; empty means time to rescan.
+        if not self.courses_cache:
             logger.info("Course cache expired, refreshing course list")
             courses = self.scan_for_courses()
         else:
@@ -253,138 +670,72 @@ class MoodleClient:
                 {'id': course_id, 'name': data['name'], 'url': data['url']}
                 for course_id, data in self.courses_cache.items()
             ]
-        
+
         active_attendances = []
-        
-        # Scan each course for attendance activities
-        for course in courses:
-            attendance_links = self.scan_course_for_attendance(course['url'])
-            for attendance in attendance_links:
-                # Check if this attendance link is active
-                check_result = self.check_attendance(attendance['url'])
-                if check_result['status'] == 'available':
-                    active_attendances.append({
-                        'course_name': course['name'],
-                        'attendance_name': attendance['name'],
-                        'url': attendance['url'],
-                        'check_result': check_result
-                    })
-        
+
+        # The per-course and per-attendance fetches are independent GETs that
+        # each block on a full round-trip to Moodle; running them through a
+        # small thread pool collapses N serial RTTs into a few batches.
+        # requests.Session is thread-safe for plain GETs.
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            scans = list(executor.map(
+                self.scan_course_for_attendance,
+                [course['url'] for course in courses]
+            ))
+
+            pending = []
+            for course, attendance_links in zip(courses, scans):
+                for attendance in attendance_links:
+                    pending.append((course, attendance))
+
+            check_results = list(executor.map(
+                self.check_attendance,
+                [attendance['url'] for _, attendance in pending]
+            ))
+
+        for (course, attendance), check_result in zip(pending, check_results):
+            if check_result['status'] == 'available':
+                active_attendances.append({
+                    'course_name': course['name'],
+                    'attendance_name': attendance['name'],
+                    'url': attendance['url'],
+                    'check_result': check_result
+                })
+
         return active_attendances
-    
+
     def check_attendance(self, lesson_url):
         """Check if attendance marking is available for a lesson"""
+        # Direct one-shot links already carry the session tokens; no page
+        # download or parse is needed to know they are actionable.
+        if 'sessid=' in lesson_url and 'sesskey=' in lesson_url:
+            return self._cache_result(
+                lesson_url, {'status': 'available', 'form_url': lesson_url, 'direct': True})
+
         # Check cache first
-        now = time.time()
-        if lesson_url in self.attendance_cache:
-            cache_entry = self.attendance_cache[lesson_url]
-            if now - cache_entry['last_checked'] < self.cache_ttl:
-                logger.info(f"Using cached attendance status for {lesson_url}")
-                return cache_entry['status']
-        
+        cached = self._cached_result(lesson_url)
+        if cached is not None:
+            logger.info("Using cached attendance status for %s", lesson_url)
+            return cached
+
         if not self.is_logged_in:
             logged_in = self.login()
             if not logged_in:
                 return {'status': 'error', 'message': 'Not logged in'}
-        
+
         try:
             # Get the lesson page
             response = self.session.get(lesson_url)
             if response.status_code != 200:
                 return {'status': 'error', 'message': f'Failed to load lesson page: {response.status_code}'}
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Option 1: Direct "Submit attendance" button
-            attendance_btn = soup.find('input', {'value': re.compile(r'отметиться|submit attendance', re.I)})
-            
-            # Option 2: Exact link text matching "Submit attendance"
-            if not attendance_btn:
-                submit_attendance_links = soup.find_all('a', text="Submit attendance")
-                if submit_attendance_links:
-                    for link in submit_attendance_links:
-                        attendance_form_url = link.get('href')
-                        if attendance_form_url and 'attendance.php' in attendance_form_url:
-                            logger.info(f"Found 'Submit attendance' link: {attendance_form_url}")
-                            result = {'status': 'available', 'form_url': attendance_form_url}
-                            # Update cache
-                            self.attendance_cache[lesson_url] = {
-                                'status': result,
-                                'last_checked': now
-                            }
-                            return result
-            
-            # Option 3: Attendance status link with regex pattern
-            if not attendance_btn:
-                attendance_link = soup.find('a', text=re.compile(r'отметиться|mark attendance|submit attendance', re.I))
-                if attendance_link:
-                    attendance_form_url = attendance_link.get('href')
-                    if attendance_form_url:
-                        logger.info(f"Found attendance link with regex: {attendance_form_url}")
-                        result = {'status': 'available', 'form_url': attendance_form_url}
-                        # Update cache
-                        self.attendance_cache[lesson_url] = {
-                            'status': result,
-                            'last_checked': now
-                        }
-                        return result
-            
-            # Option 4: Check for "Submit attendance" or similar text anywhere on the page
-            submit_text = soup.find(text=re.compile(r'submit attendance|mark attendance|присутствие', re.I))
-            if submit_text:
-                # Try to find parent link
-                parent = submit_text.parent
-                while parent and parent.name != 'a' and parent.name != 'body':
-                    parent = parent.parent
-                
-                if parent and parent.name == 'a':
-                    attendance_form_url = parent.get('href')
-                    if attendance_form_url:
-                        logger.info(f"Found attendance text with parent link: {attendance_form_url}")
-                        result = {'status': 'available', 'form_url': attendance_form_url}
-                        # Update cache
-                        self.attendance_cache[lesson_url] = {
-                            'status': result,
-                            'last_checked': now
-                        }
-                        return result
-            
-            # Option 5: Check for attendance section
-            attendance_section = soup.find(['div', 'section'], {'class': re.compile(r'attendance')})
-            if attendance_section:
-                # Look for form or links in the attendance section
-                form = attendance_section.find('form')
-                if form:
-                    result = {'status': 'available', 'form_action': form.get('action')}
-                    # Update cache
-                    self.attendance_cache[lesson_url] = {
-                        'status': result,
-                        'last_checked': now
-                    }
-                    return result
-            
-            if attendance_btn:
-                result = {'status': 'available', 'button_found': True}
-                # Update cache
-                self.attendance_cache[lesson_url] = {
-                    'status': result,
-                    'last_checked': now
-                }
-                return result
-            
-            # No attendance found
-            result = {'status': 'not_available', 'message': 'No attendance marking option found'}
-            # Update cache
-            self.attendance_cache[lesson_url] = {
-                'status': result,
-                'last_checked': now
-            }
-            return result
-                
+
+            result = _parse_attendance_page(response.text)
+            return self._cache_result(lesson_url, result)
+
         except Exception as e:
-            logger.error(f"Error checking attendance: {str(e)}")
+            logger.error("Error checking attendance: %s", str(e))
             return {'status': 'error', 'message': str(e)}
-                
+
     def submit_attendance(self, form_url):
         """Submit attendance form using the provided form URL"""
         if not self.is_logged_in:
@@ -394,60 +745,25 @@ class MoodleClient:
 
         try:
             # Load the form page
-            logger.info(f"Getting attendance form: {form_url}")
+            logger.info("Getting attendance form: %s", form_url)
             response = self.session.get(form_url)
             if response.status_code != 200:
                 return {'status': 'error', 'message': f'Failed to load form: {response.status_code}'}
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-            form = soup.find('form')
-            if not form:
+            form_data = _build_attendance_payload(response.text, form_url)
+            if form_data is None:
                 return {'status': 'error', 'message': 'Attendance form not found'}
-
-            # Build payload from inputs
-            payload = {}
-            radios = []
-            for inp in form.find_all('input'):
-                name = inp.get('name')
-                if not name:
-                    continue
-                itype = (inp.get('type') or '').lower()
-                if itype in ['radio', 'checkbox']:
-                    if itype == 'radio':
-                        radios.append(inp)
-                    continue
-                payload[name] = inp.get('value', '')
-
-            # Try to pick "Present"-like status
-            chosen = False
-            for r in radios:
-                label_text = ''
-                label = r.find_parent('label')
-                if label:
-                    label_text = label.get_text(strip=True).lower()
-                if any(k in label_text for k in ['present', 'присутств', 'присутн', 'відвідав', 'відвідування']):
-                    payload[r.get('name')] = r.get('value')
-                    chosen = True
-                    break
-            if not chosen and radios:
-                payload[radios[0].get('name')] = radios[0].get('value')
-
-            # Determine action
-            action = form.get('action') or form_url
-            if action.startswith('/'):
-                action = f"{MOODLE_BASE_URL}{action}"
+            action, payload = form_data
 
             post = self.session.post(action, data=payload)
             if post.status_code != 200:
                 return {'status': 'error', 'message': f'Failed to submit form: {post.status_code}'}
 
-            body = post.text.lower()
-            success_markers = ['attendance has been recorded', 'успешно', 'успішно', 'відмічено', 'attendance: status set']
-            if any(m in body for m in success_markers):
+            if _is_submit_successful(post.text):
                 return {'status': 'success'}
             return {'status': 'unknown', 'message': 'Submission response unclear'}
         except Exception as e:
-            logger.error(f"Error submitting attendance: {str(e)}")
+            logger.error("Error submitting attendance: %s", str(e))
             return {'status': 'error', 'message': str(e)}
 
     def mark_attendance(self, lesson_url):
@@ -459,5 +775,296 @@ class MoodleClient:
             form_url = check.get('form_url') or check.get('form_action') or lesson_url
             return self.submit_attendance(form_url)
         except Exception as e:
-            logger.error(f"Error in mark_attendance: {str(e)}")
+            logger.error("Error in mark_attendance: %s", str(e))
+            return {'status': 'error', 'message': str(e)}
+
+
+class AsyncMoodleClient:
+    """Non-blocking Moodle client built on aiohttp.
+
+    Mirrors MoodleClient but performs HTTP over a reusable
+    aiohttp.ClientSession so attendance checks for many users can run
+    concurrently instead of serializing the event loop.
+    """
+
+    def __init__(self, username=None, password=None, is_encrypted=False):
+        self.username = username
+        self.password = _decrypt_password(password, is_encrypted)
+
+        # The ClientSession is created lazily because it must be bound to a
+        # running event loop; it is then reused for every request.
+        self.session = None
+        self.is_logged_in = False
+
+        # Bound in-flight requests and overall request rate so a fan-out over
+        # many users/lessons can't hammer the Moodle server into throttling.
+        self._sem = asyncio.Semaphore(8)
+        self._limiter = AsyncLimiter(20, 1)  # max 20 requests per second
+
+        # Кэш для хранения информации о курсах и доступных отметках
+        self.cache_ttl = 300  # Время жизни кэша в секундах (5 минут)
+        self.negative_cache_ttl = 60  # 'not available' ages out faster
+        self.courses_cache = TTLCache(maxsize=256, ttl=self.cache_ttl)  # {course_id: {name, url}}
+        self.attendance_cache = TTLCache(maxsize=2048, ttl=self.cache_ttl)  # {url: (monotonic_ts, result)}
+
+    # Same tuple/monotonic cache scheme and course-cache refresh as MoodleClient.
+    _cache_result = MoodleClient._cache_result
+    _cached_result = MoodleClient._cached_result
+    _store_courses = MoodleClient._store_courses
+    _persist_courses = MoodleClient._persist_courses
+
+    def _get_session(self):
+        """Return the shared ClientSession, creating it on first use."""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=20, limit_per_host=8, ssl=False)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def _fetch(self, method, url, **kwargs):
+        """Perform a rate-limited HTTP request with bounded retries.
+
+        Transient network failures are retried twice with exponential
+        backoff (0.3s, 0.6s); the final failure propagates to the caller.
+        Returns (status, body text, final URL after redirects).
+        """
+        session = self._get_session()
+        kwargs.setdefault('timeout', aiohttp.ClientTimeout(total=15))
+        last_error = None
+        for attempt in range(3):
+            try:
+                async with self._sem:
+                    async with self._limiter:
+                        async with session.request(method, url, **kwargs) as response:
+                            return response.status, await response.text(), str(response.url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+                if attempt < 2:
+                    await asyncio.sleep(0.3 * 2 ** attempt)
+        raise last_error
+
+    async def close(self):
+        """Close the underlying HTTP session."""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def validate_credentials(self):
+        """Validate if the provided credentials can successfully log in to DL"""
+        if not self.username or not self.password:
+            logger.warning("Username or password not provided")
+            return False
+
+        login_result = await self.login()
+        logger.info("Credentials validation %s for user %s", 'successful' if login_result else 'failed', self.username)
+        return login_result
+
+    async def login(self):
+        """Log in to Moodle"""
+        if not self.username or not self.password:
+            logger.error("Username or password not provided")
+            return False
+
+        try:
+            # Get login page to extract form token
+            _, login_html, _ = await self._fetch('GET', LOGIN_URL)
+
+            # Parse off-loop so large pages don't stall the event loop
+            token = await asyncio.to_thread(_extract_login_token, login_html)
+            if token is None:
+                return False
+
+            # Prepare login payload
+            payload = {
+                'username': self.username,
+                'password': self.password,
+                'logintoken': token,
+                'anchor': ''
+            }
+
+            # Submit login form
+            _, _, final_url = await self._fetch('POST', LOGIN_URL, data=payload)
+            self.is_logged_in = 'loginerrors' not in final_url
+
+            if self.is_logged_in:
+                logger.info("Successfully logged in as %s", self.username)
+            else:
+                logger.error("Failed to log in as %s", self.username)
+
+            return self.is_logged_in
+
+        except Exception as e:
+            logger.error("Error during login: %s", str(e))
+            return False
+
+    async def get_dashboard(self):
+        """Get user's Moodle dashboard to find all active courses"""
+        if not self.is_logged_in:
+            if not await self.login():
+                return None
+
+        try:
+            status, html, _ = await self._fetch('GET', f"{MOODLE_BASE_URL}/my/")
+            if status != 200:
+                logger.error("Failed to load dashboard: %s", status)
+                return None
+            return html
+        except Exception as e:
+            logger.error("Error getting dashboard: %s", str(e))
+            return None
+
+    async def scan_for_courses(self):
+        """Scan the dashboard to find all active courses"""
+        dashboard_html = await self.get_dashboard()
+        if not dashboard_html:
+            return []
+
+        courses = await asyncio.to_thread(_parse_courses, dashboard_html)
+        self._store_courses(courses)
+        return courses
+
+    async def scan_course_for_attendance(self, course_url):
+        """Scan a course page for attendance activities"""
+        if not self.is_logged_in:
+            if not await self.login():
+                return []
+
+        try:
+            status, html, _ = await self._fetch('GET', course_url)
+            if status != 200:
+                logger.error("Failed to load course page: %s", status)
+                return []
+
+            return await asyncio.to_thread(_parse_attendance_links, html)
+        except Exception as e:
+            logger.error("Error scanning course for attendance: %s", str(e))
+            return []
+
+    async def find_all_active_attendance_marks(self):
+        """Find all active attendance marks across all courses, concurrently.
+
+        Course pages and attendance checks fan out through the shared
+        session with asyncio.gather; the semaphore and rate limiter in
+        _fetch keep the concurrency within polite bounds.
+        """
+        # TTLCache expires entries by itself; empty means time to rescan.
+        if not self.courses_cache:
+            logger.info("Course cache expired, refreshing course list")
+            courses = await self.scan_for_courses()
+        else:
+            logger.info("Using cached course list")
+            courses = [
+                {'id': course_id, 'name': data['name'], 'url': data['url']}
+                for course_id, data in self.courses_cache.items()
+            ]
+
+        scans = await asyncio.gather(
+            *[self.scan_course_for_attendance(course['url']) for course in courses],
+            return_exceptions=True
+        )
+
+        pending = []
+        for course, attendance_links in zip(courses, scans):
+            if isinstance(attendance_links, Exception):
+                logger.error("Error scanning course %s: %s", course['url'], attendance_links)
+                continue
+            for attendance in attendance_links:
+                pending.append((course, attendance))
+
+        check_results = await asyncio.gather(
+            *[self.check_attendance(attendance['url']) for _, attendance in pending],
+            return_exceptions=True
+        )
+
+        active_attendances = []
+        for (course, attendance), check_result in zip(pending, check_results):
+            if isinstance(check_result, Exception):
+                logger.error("Error checking attendance %s: %s", attendance['url'], check_result)
+                continue
+            if check_result['status'] == 'available':
+                active_attendances.append({
+                    'course_name': course['name'],
+                    'attendance_name': attendance['name'],
+                    'url': attendance['url'],
+                    'check_result': check_result
+                })
+
+        return active_attendances
+
+    async def check_attendance(self, lesson_url):
+        """Check if attendance marking is available for a lesson"""
+        # Direct one-shot links already carry the session tokens; no page
+        # download or parse is needed to know they are actionable.
+        if 'sessid=' in lesson_url and 'sesskey=' in lesson_url:
+            return self._cache_result(
+                lesson_url, {'status': 'available', 'form_url': lesson_url, 'direct': True})
+
+        # Check cache first
+        cached = self._cached_result(lesson_url)
+        if cached is not None:
+            logger.info("Using cached attendance status for %s", lesson_url)
+            return cached
+
+        if not self.is_logged_in:
+            logged_in = await self.login()
+            if not logged_in:
+                return {'status': 'error', 'message': 'Not logged in'}
+
+        try:
+            # Get the lesson page
+            status, html, _ = await self._fetch('GET', lesson_url)
+            if status != 200:
+                return {'status': 'error', 'message': f'Failed to load lesson page: {status}'}
+
+            result = await asyncio.to_thread(_parse_attendance_page, html)
+            return self._cache_result(lesson_url, result)
+
+        except Exception as e:
+            logger.error("Error checking attendance: %s", str(e))
+            return {'status': 'error', 'message': str(e)}
+
+    async def submit_attendance(self, form_url):
+        """Submit attendance form using the provided form URL"""
+        if not self.is_logged_in:
+            logged_in = await self.login()
+            if not logged_in:
+                return {'status': 'error', 'message': 'Not logged in'}
+
+        try:
+            # Load the form page
+            logger.info("Getting attendance form: %s", form_url)
+            status, html, _ = await self._fetch('GET', form_url)
+            if status != 200:
+                return {'status': 'error', 'message': f'Failed to load form: {status}'}
+
+            form_data = await asyncio.to_thread(_build_attendance_payload, html, form_url)
+            if form_data is None:
+                return {'status': 'error', 'message': 'Attendance form not found'}
+            action, payload = form_data
+
+            status, body, _ = await self._fetch('POST', action, data=payload)
+            if status != 200:
+                return {'status': 'error', 'message': f'Failed to submit form: {status}'}
+
+            if _is_submit_successful(body):
+                return {'status': 'success'}
+            return {'status': 'unknown', 'message': 'Submission response unclear'}
+        except Exception as e:
+            logger.error("Error submitting attendance: %s", str(e))
+            return {'status': 'error', 'message': str(e)}
+
+    async def mark_attendance(self, lesson_url):
+        """Check availability and submit attendance when possible"""
+        try:
+            check = await self.check_attendance(lesson_url)
+            if check.get('status') != 'available':
+                return {'status': 'not_available', 'message': check.get('message', 'Not available')}
+            form_url = check.get('form_url') or check.get('form_action') or lesson_url
+            return await self.submit_attendance(form_url)
+        except Exception as e:
+            logger.error("Error in mark_attendance: %s", str(e))
             return {'status': 'error', 'message': str(e)}
@@ -4,11 +4,8 @@ import logging
 from datetime import datetime, timedelta, time
 import pytz
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Logging is configured once by the bot entrypoint; library modules only
+# take a named logger.
 logger = logging.getLogger(__name__)
 
 class SimpleScheduleParser:
@@ -2,49 +2,111 @@ import logging
 import datetime
 import pytz
 import asyncio
+from collections import defaultdict
 from typing import Dict, List, Optional, Tuple
-from apscheduler.schedulers.background import BackgroundScheduler
+from aiogram.exceptions import TelegramRetryAfter
+from aiolimiter import AsyncLimiter
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from db.models import get_db_session, User
 from db.database import DatabaseManager
-from moodle.client import MoodleClient
+from moodle.client import AsyncMoodleClient
 from simple_schedule_parser import SimpleScheduleParser
 from config import CHECK_INTERVAL_MINUTES
 import os.path
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Logging is configured once by the bot entrypoint; library modules only
+# take a named logger.
 logger = logging.getLogger(__name__)
 
+# pytz.timezone() does a registry lookup and builds the tzinfo each call;
+# the bot only ever works in Kyiv time, so resolve it once at import.
+KIEV_TZ = pytz.timezone('Europe/Kiev')
+
 
 class AttendanceScheduler:
     """Scheduler for periodic attendance checks"""
     
     def __init__(self, bot=None):
         """Initialize the scheduler"""
-        self.scheduler = BackgroundScheduler(timezone=pytz.timezone('Europe/Kiev'))
+        # AsyncIOScheduler runs coroutine jobs directly on the bot's event
+        # loop — no thread and no throwaway per-tick event loop. coalesce and
+        # max_instances keep a slow tick from piling up behind itself.
+        self.scheduler = AsyncIOScheduler(
+            timezone=KIEV_TZ,
+            job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 60}
+        )
         self.bot = bot  # Telegram bot instance for sending notifications
         
         # Initialize the schedule parser
-        schedule_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
+        schedule_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
                                     'TimeTable.csv')
         self.schedule_parser = SimpleScheduleParser(schedule_path)
+
+        # Keep strong references to fire-and-forget tasks; asyncio only holds
+        # a weak reference, so untracked tasks can be garbage-collected mid-flight.
+        self._background_tasks = set()
+
+        # Telegram allows ~30 msg/s per bot and ~1 msg/s per chat; staying
+        # under both means a burst of notifications never trips 429 retries.
+        self._send_limiter = AsyncLimiter(30, 1)
+        self._chat_limiters = defaultdict(lambda: AsyncLimiter(1, 1))
+
+        # user.id -> (credentials, AsyncMoodleClient). Reusing clients across
+        # ticks keeps the MoodleSession cookie and connection pool warm, so
+        # most ticks skip the two-request login dance entirely.
+        self._clients = {}
+
+        # Notifications are funnelled through one queue with a single
+        # consumer task, so a tick that marks many lessons enqueues cheaply
+        # instead of spawning one send task per message.
+        self._notify_queue = None
+        self._notify_worker = None
+
+        # Last class-time lookup, keyed by the minute it was computed for.
+        # The schedule only changes on reload, so within a minute every
+        # caller gets the memoized answer instead of a fresh schedule scan.
+        self._class_time_memo = (None, None)
+
+    def _get_client(self, user):
+        """Return a cached AsyncMoodleClient for this user, recreating it
+        only when the stored credentials change."""
+        credentials = (user.moodle_username, user.encrypted_password)
+        cached = self._clients.get(user.id)
+        if cached is not None:
+            if cached[0] == credentials:
+                return cached[1]
+            # Credentials changed: drop the stale client (close in background)
+            self._create_task(cached[1].close())
+
+        client = AsyncMoodleClient(user.moodle_username, user.encrypted_password, is_encrypted=True)
+        self._clients[user.id] = (credentials, client)
+        return client
+
+    def _create_task(self, coro):
+        """Create a background task that stays referenced until it finishes."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
     
     def start(self):
         """Start the scheduler"""
         # Check all attendance links on configured interval
         self.scheduler.add_job(
-            self._run_check_attendance, 
-            'interval', 
+            self._run_check_attendance_async,
+            'interval',
             minutes=CHECK_INTERVAL_MINUTES,
+            jitter=30,  # Spread ticks so restarts don't hit Moodle on the same second
             next_run_time=datetime.datetime.now(pytz.UTC) + datetime.timedelta(seconds=10)  # Start first check after 10 seconds
         )
         
         self.scheduler.start()
-        
+
+        # Start the notification consumer on the now-running loop
+        self._notify_queue = asyncio.Queue()
+        self._notify_worker = asyncio.create_task(self._run_notify_worker())
+
         # Load the schedule data
         self.schedule_parser.load_schedule()
         
@@ -55,6 +117,7 @@ class AttendanceScheduler:
         logger.info("Reloading schedule from CSV file")
         try:
             result = self.schedule_parser.load_schedule()
+            self._class_time_memo = (None, None)
             if result:
                 logger.info("Successfully reloaded schedule")
             else:
@@ -64,21 +127,6 @@ class AttendanceScheduler:
             logger.error(f"Error reloading schedule: {e}")
             return False
     
-    def _run_check_attendance(self):
-        """Non-async wrapper for async attendance check to be used with scheduler"""
-        try:
-            # Create a new event loop for current thread
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            # Run async check in this thread
-            loop.run_until_complete(self._run_check_attendance_async())
-            
-            # Close event loop
-            loop.close()
-        except Exception as e:
-            logger.error(f"Error scheduling attendance check: {e}")
-    
     def check_is_class_time(self, current_time=None):
         """Check if it's currently class time based on the CSV schedule.
         
@@ -91,49 +139,78 @@ class AttendanceScheduler:
               - dict: Information about the current class if it's class time, None otherwise
         """
         try:
-            return self.schedule_parser.is_class_time(current_time)
+            now = current_time if current_time is not None else datetime.datetime.now(KIEV_TZ)
+            key = now.replace(second=0, microsecond=0)
+            if self._class_time_memo[0] == key:
+                return self._class_time_memo[1]
+
+            result = self.schedule_parser.is_class_time(now)
+            self._class_time_memo = (key, result)
+            return result
         except Exception as e:
             logger.error(f"Error checking class time: {e}")
             return True, None  # In case of error, return True (assume it's class time)
         
+    async def _run_notify_worker(self):
+        """Drain the notification queue one message at a time.
+
+        send_notification already applies the global and per-chat rate
+        limiters, so the single consumer just serializes the Bot API
+        calls instead of fanning out a task per message."""
+        while True:
+            chat_id, text = await self._notify_queue.get()
+            try:
+                await self.send_notification(chat_id, text)
+            except Exception as e:
+                logger.error(f"Error sending queued notification to {chat_id}: {e}")
+            finally:
+                self._notify_queue.task_done()
+
+    def _queue_notification(self, chat_id, text):
+        """Enqueue a notification; falls back to a direct send task if the
+        worker isn't running (e.g. checks triggered before start())."""
+        if self._notify_queue is not None:
+            self._notify_queue.put_nowait((chat_id, text))
+        else:
+            self._create_task(self.send_notification(chat_id, text))
+
     def stop(self):
         """Stop the scheduler"""
         self.scheduler.shutdown()
+
+        if self._notify_worker is not None:
+            self._notify_worker.cancel()
+            self._notify_worker = None
+            self._notify_queue = None
+
+        # Close the cached Moodle clients' HTTP sessions if a loop is running
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            for _, client in self._clients.values():
+                self._create_task(client.close())
+        self._clients.clear()
+
         logger.info("Scheduler stopped")
             
     async def _run_check_attendance_async(self):
-        """Run the attendance check for all users"""
-        logger.info("Starting attendance check for all users")
-        
+        """Scheduler job entrypoint for the attendance tick.
+
+        check_all_attendances owns the tick's single session and
+        users-with-lessons query (an empty result simply gathers nothing),
+        so no pre-flight query is run here."""
         try:
-            session = get_db_session()
-            try:
-                # Get all active users with their lessons
-                user_lessons = DatabaseManager.get_all_active_users_and_lessons(session)
-                # Extract users
-                users = [user for user, _ in user_lessons] if user_lessons else []
-                
-                if not users:
-                    logger.info("No users found for attendance check")
-                    return
-                
-                # Check attendance for all users
-                await self.check_all_attendances()
-                    
-            except Exception as e:
-                logger.error(f"Error in attendance check: {str(e)}")
-            finally:
-                session.close()
-                
+            await self.check_all_attendances()
         except Exception as e:
             logger.error(f"Error in attendance check: {str(e)}")
     
     def is_within_working_hours(self):
         """Check if current time is within working hours (7:45-18:15 Kyiv time)"""
         try:
-            kyiv_tz = pytz.timezone('Europe/Kiev')
-            now = datetime.datetime.now(kyiv_tz)
-            
+            now = datetime.datetime.now(KIEV_TZ)
+
             # Skip weekends (Saturday=5, Sunday=6)
             if now.weekday() >= 5:
                 logger.info("Skipping attendance check - it's weekend")
@@ -163,9 +240,8 @@ class AttendanceScheduler:
             
         # Check if there are any classes scheduled for today
         try:
-            kyiv_tz = pytz.timezone('Europe/Kiev')
-            now = datetime.datetime.now(kyiv_tz)
-            
+            now = datetime.datetime.now(KIEV_TZ)
+
             # Get today's schedule - for now we're using ІТШІ timetable as default
             today_schedule = self.schedule_parser.get_schedule_for_date(now)
             
@@ -182,46 +258,58 @@ class AttendanceScheduler:
         
         session = get_db_session()
         try:
-            # Get all active users with their lessons
+            # Get all active users with their active lessons in one query;
+            # no per-user lessons lookup is needed below
             user_lessons = DatabaseManager.get_all_active_users_and_lessons(session)
-            # Extract users
-            users = [user for user, _ in user_lessons] if user_lessons else []
-            
-            for user in users:
-                try:
-                    # Skip if user has no credentials or is inactive
-                    if not user.moodle_username or not user.encrypted_password or not user.active:
-                        continue
-                    
-                    # Skip if user has no group set (temporarily allow users without group)
-                    if not user.group:
-                        logger.info(f"User {user.telegram_id} has no group set, using default ІТШІ group")
-                        # For now, assume ІТШІ for users without a group
-                        effective_group = "ІТШІ"
-                    else:
-                        effective_group = user.group
-                        
-                    # For now, we only have ІТШІ schedule, so check if user is in that group
-                    # In future, this can be extended to other groups
-                    if effective_group != "ІТШІ":
-                        logger.info(f"User {user.telegram_id} is in group {effective_group}, but we only have schedule for ІТШІ. Using ІТШІ schedule.")
-                    
-                    # Get all lessons for this user, regardless of status
-                    all_lessons = DatabaseManager.get_user_lessons(session, user.telegram_id)
-                    
-                    # Check attendance for all lessons
-                    await self.check_user_attendances(user, all_lessons)
-                    
-                except Exception as e:
-                    logger.error(f"Error checking attendance for user {user.telegram_id}: {str(e)}")
+
+            # Bound how many users are processed at once so a large user base
+            # doesn't fan out into hundreds of Moodle requests in one tick
+            user_sem = asyncio.Semaphore(10)
+
+            async def bounded_check(user, lessons):
+                async with user_sem:
+                    await self.check_user_attendances(user, lessons, session)
+
+            tasks = []
+            eligible_users = []
+            for user, lessons in user_lessons:
+                # Inactive and credential-less users are already filtered
+                # out in the query, so every row here is eligible
+
+                # Skip if user has no group set (temporarily allow users without group)
+                if not user.group:
+                    logger.info(f"User {user.telegram_id} has no group set, using default ІТШІ group")
+                    # For now, assume ІТШІ for users without a group
+                    effective_group = "ІТШІ"
+                else:
+                    effective_group = user.group
+
+                # For now, we only have ІТШІ schedule, so check if user is in that group
+                # In future, this can be extended to other groups
+                if effective_group != "ІТШІ":
+                    logger.info(f"User {user.telegram_id} is in group {effective_group}, but we only have schedule for ІТШІ. Using ІТШІ schedule.")
+
+                # Check attendance for the lessons loaded alongside the user
+                eligible_users.append(user)
+                tasks.append(bounded_check(user, lessons))
+
+            # Run all users concurrently; one failing user must not kill the batch
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for user, result in zip(eligible_users, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error checking attendance for user {user.telegram_id}: {str(result)}")
         
         except Exception as e:
             logger.error(f"Error in attendance check: {str(e)}")
         finally:
             session.close()
     
-    async def check_user_attendances(self, user, lessons):
-        """Check and mark attendance for a user's lessons"""
+    async def check_user_attendances(self, user, lessons, session):
+        """Check and mark attendance for a user's lessons.
+
+        Reuses the tick-wide session owned (and closed) by
+        check_all_attendances; the bulk updates below never cross an await,
+        so concurrent users can't interleave inside a transaction."""
         logger.info(f"Checking attendance for user {user.telegram_id}, {len(lessons)} lessons")
         
         try:
@@ -230,88 +318,113 @@ class AttendanceScheduler:
                 logger.info(f"No lessons found for user {user.telegram_id}")
                 return
             
-            # Get Moodle client for this user (password is stored encrypted)
-            client = MoodleClient(user.moodle_username, user.encrypted_password, is_encrypted=True)
-            
-            # Process all lessons without filtering by current class or subject
-            for lesson in lessons:
-                # Skip inactive lessons
-                if not lesson.active:
+            # Get Moodle client for this user (password is stored encrypted);
+            # the client persists across ticks so cookies and connections are reused
+            client = self._get_client(user)
+
+            # Process all lessons without filtering by current class or subject,
+            # collecting lesson ids so time bookkeeping is flushed in two
+            # UPDATEs instead of a commit per lesson
+            active_lessons = [lesson for lesson in lessons if lesson.active]
+
+            # Check all lessons concurrently; the client's own semaphore and
+            # rate limiter cap how many requests actually hit Moodle at once,
+            # so no fixed sleep between lessons is needed
+            results = await asyncio.gather(
+                *(self.check_lesson_attendance(user, lesson, client) for lesson in active_lessons),
+                return_exceptions=True
+            )
+
+            checked_ids = []
+            marked_ids = []
+            for lesson, marked in zip(active_lessons, results):
+                if isinstance(marked, Exception):
+                    logger.error(f"Error checking lesson {lesson.id} for user {user.telegram_id}: {marked}")
                     continue
-                
-                # Check attendance for this lesson
-                await self.check_lesson_attendance(user, lesson, client)
-                
-                # Add a small delay between requests to avoid rate limiting
-                await asyncio.sleep(1)
-                
+                checked_ids.append(lesson.id)
+                if marked:
+                    marked_ids.append(lesson.id)
+
+            if checked_ids:
+                DatabaseManager.bulk_update_check_times(session, checked_ids)
+                DatabaseManager.bulk_update_mark_times(session, marked_ids)
+
         except Exception as e:
             logger.error(f"Error processing lessons for user {user.telegram_id}: {e}")
                 
     # Helper method for sending notifications
     async def send_notification(self, chat_id, text):
-        if self.bot:
-            await self.bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                disable_notification=True
-            )
+        if not self.bot:
+            return
+
+        async with self._send_limiter:
+            async with self._chat_limiters[chat_id]:
+                try:
+                    await self.bot.send_message(
+                        chat_id=chat_id,
+                        text=text,
+                        disable_notification=True
+                    )
+                except TelegramRetryAfter as e:
+                    # Respect the flood-wait once instead of letting the
+                    # exception bubble up and kill the notification task
+                    logger.warning(f"Flood wait from Telegram, retrying in {e.retry_after}s")
+                    await asyncio.sleep(e.retry_after)
+                    await self.bot.send_message(
+                        chat_id=chat_id,
+                        text=text,
+                        disable_notification=True
+                    )
     
     async def check_lesson_attendance(self, user, lesson, client):
-        """Check and mark attendance for a specific lesson"""
+        """Check and mark attendance for a specific lesson.
+
+        Returns True when attendance was marked; the caller batches the
+        last_checked/last_marked bookkeeping for the whole lesson list.
+        """
         logger.info(f"Checking attendance for user {user.telegram_id}, lesson {lesson.id}")
-        
-        session = get_db_session()
+
         try:
-            # Update last check time
-            DatabaseManager.update_lesson_check_time(session, lesson.id)
-            
             # Check if attendance is available
-            check_result = client.check_attendance(lesson.url)
-            
+            check_result = await client.check_attendance(lesson.url)
+
             if check_result['status'] == 'available':
                 # Attendance is available, mark it
-                result = client.mark_attendance(lesson.url)
-                
+                result = await client.mark_attendance(lesson.url)
+
                 if result['status'] == 'success':
-                    # Update last marked time
-                    DatabaseManager.update_lesson_mark_time(session, lesson.id)
-                    
                     # Notify user about successful marking
                     if self.bot:
-                        import asyncio
                         lesson_name = lesson.name or f"Заняття #{lesson.id}"
                         try:
-                            asyncio.create_task(self.send_notification(
+                            self._queue_notification(
                                 user.telegram_id,
                                 f"✅ Успішно відмічено присутність на предметі: {lesson_name}!"
-                            ))
+                            )
                         except Exception as e:
                             logger.error(f"Error sending success notification: {str(e)}")
+                    return True
                 else:
                     # Notify about error
                     if self.bot:
-                        import asyncio
                         lesson_name = lesson.name or f"Заняття #{lesson.id}"
                         try:
-                            asyncio.create_task(self.send_notification(
+                            self._queue_notification(
                                 user.telegram_id,
                                 f"❌ Не вдалося відмітитись на предметі {lesson_name}: {result['message']}"
-                            ))
+                            )
                         except Exception as e:
                             logger.error(f"Error sending error notification: {str(e)}")
         
         except Exception as e:
             logger.error(f"Error checking lesson {lesson.id} for user {user.telegram_id}: {str(e)}")
             if self.bot:
-                import asyncio
                 try:
-                    asyncio.create_task(self.send_notification(
+                    self._queue_notification(
                         user.telegram_id,
                         f"❌ Помилка перевірки відвідуваності: {str(e)}"
-                    ))
+                    )
                 except Exception as notify_error:
                     logger.error(f"Error sending exception notification: {str(notify_error)}")
-        
-        finally:
-            session.close()
+
+        return False
@@ -1,11 +1,5 @@
-import threading
 import subprocess
 import sys
-import time
-
-def _run_health():
-    from health_server import start_health_server
-    start_health_server()
 
 
 def _run_bot():
@@ -14,9 +8,7 @@ def _run_bot():
 
 
 if __name__ == "__main__":
-    t = threading.Thread(target=_run_health, daemon=True)
-    t.start()
-    # Give the health server a moment to bind the port
-    time.sleep(0.5)
+    # bot.py starts the aiohttp health server on its own event loop before
+    # polling, so this launcher no longer runs a separate health thread.
     exit_code = _run_bot()
-    sys.exit(exit_code)
\ No newline at end of file
+    sys.exit(exit_code)
@@ -15,11 +15,8 @@ from config import MOODLE_BASE_URL
 from simple_schedule_parser import SimpleScheduleParser
 import logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Logging is configured once by the bot entrypoint; library modules only
+# take a named logger.
 logger = logging.getLogger(__name__)
 
 